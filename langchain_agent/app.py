@@ -1,40 +1,20 @@
 import argparse
-from typing import Dict
+from functools import lru_cache
 
-from dotenv import load_dotenv
 from langchain.agents import create_agent
 from langchain.tools import tool
 from langchain_core.messages import AIMessage, BaseMessage
-from langchain_openai import ChatOpenAI
-
-load_dotenv()
-
-POLICIES: Dict[str, str] = {
-    "refund": (
-        "Refunds: Full refunds are allowed within 30 days of purchase if the item "
-        "is unused. Partial refunds (up to 50%) are allowed for used items within "
-        "30 days. No refunds after 30 days."
-    ),
-    "shipping": (
-        "Shipping: Standard shipping is 5-7 business days. Expedited shipping is "
-        "2-3 business days. Delays over 10 business days qualify for a 10% credit."
-    ),
-    "billing": (
-        "Billing: Duplicate charges can be reversed within 5 business days. "
-        "Chargebacks are escalated to a human agent immediately."
-    ),
-    "technical": (
-        "Technical: Troubleshoot by confirming account access, resetting password, "
-        "and clearing cache. Escalate if the user is locked out for more than 24 hours."
-    ),
-}
 
+from llm_client import LLM
+from policies import POLICY_AUTOMATON
+from prompts import SYSTEM_PREFIX
 
+
+@lru_cache(maxsize=256)
 def _match_policy(topic: str) -> str:
-    topic_lower = topic.lower()
-    for key, value in POLICIES.items():
-        if key in topic_lower:
-            return value
+    # One pass over the topic; the earliest policy key in the text wins.
+    for _, value in POLICY_AUTOMATON.iter(topic.casefold()):
+        return value
     return "No matching policy found. Use best judgment and keep reply concise."
 
 
@@ -54,21 +34,32 @@ def calculate_refund(amount: float, percent: float) -> str:
 
 
 def _last_ai_message(messages: list[BaseMessage]) -> BaseMessage:
-    for message in reversed(messages):
-        if isinstance(message, AIMessage):
-            return message
-    return messages[-1]
+    return next(
+        (message for message in reversed(messages) if isinstance(message, AIMessage)),
+        messages[-1],
+    )
+
 
+# The shared SYSTEM_PREFIX pushes the static part of the prompt past OpenAI's
+# 1024-token caching threshold; only the user turn and tool results vary.
+SYSTEM_PROMPT = (
+    SYSTEM_PREFIX
+    + "\n"
+    "Step: agent. Handle the whole ticket yourself. Use tools when they help: "
+    "lookup_policy returns the policy for a topic, and calculate_refund turns "
+    "an amount and a percent into a refund amount. Return a JSON object with "
+    "keys: category, needs_human, reply. category is one of the categories "
+    "above, needs_human is true for chargebacks, legal threats, or lawsuits, "
+    "and reply follows the style guide."
+)
 
+
+@lru_cache(maxsize=1)
 def build_agent():
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+    # A shallow copy keeps the shared HTTP clients and only adds the cache key.
+    llm = LLM.model_copy(update={"model_kwargs": {"prompt_cache_key": "support-agent"}})
     tools = [lookup_policy, calculate_refund]
-    system_prompt = (
-        "You are a support agent. Use tools when they help. "
-        "Return a JSON object with keys: category, needs_human, reply. "
-        "Keep reply under 120 words."
-    )
-    return create_agent(llm, tools=tools, system_prompt=system_prompt)
+    return create_agent(llm, tools=tools, system_prompt=SYSTEM_PROMPT)
 
 
 def main() -> None:
@@ -1,123 +1,214 @@
 import argparse
-from typing import Dict, TypedDict
-
-from dotenv import load_dotenv
+import asyncio
+import json
+import operator
+import os
+import re
+import sys
+from functools import lru_cache
+from typing import (
+    Annotated,
+    Literal,
+    Optional,
+    TypedDict,
+    Union,
+    get_origin,
+    get_type_hints,
+)
+
+from langchain_core.caches import InMemoryCache
+from langchain_core.globals import set_llm_cache
+from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from langgraph.graph import END, StateGraph
-
-load_dotenv()
-
-POLICIES: Dict[str, str] = {
-    "refund": (
-        "Refunds: Full refunds are allowed within 30 days of purchase if the item "
-        "is unused. Partial refunds (up to 50%) are allowed for used items within "
-        "30 days. No refunds after 30 days."
-    ),
-    "shipping": (
-        "Shipping: Standard shipping is 5-7 business days. Expedited shipping is "
-        "2-3 business days. Delays over 10 business days qualify for a 10% credit."
-    ),
-    "billing": (
-        "Billing: Duplicate charges can be reversed within 5 business days. "
-        "Chargebacks are escalated to a human agent immediately."
-    ),
-    "technical": (
-        "Technical: Troubleshoot by confirming account access, resetting password, "
-        "and clearing cache. Escalate if the user is locked out for more than 24 hours."
-    ),
-    "other": "General: Be polite, ask clarifying questions, and offer next steps.",
+from langgraph.graph import END, START, StateGraph
+from openai import AsyncOpenAI
+from pydantic import BaseModel, ValidationError
+
+from llm_client import LLM, SHARED_ASYNC_HTTP
+from plan_cache import PlanCache
+from policies import ALLOWED_CATEGORIES, POLICIES
+from prompts import SYSTEM_PREFIX
+
+# Matched against the casefolded message, so no IGNORECASE is needed.
+_HANDOFF_RE = re.compile(r"chargeback|legal|lawsuit")
+
+_KEYWORD_RE = re.compile(r"\w{5,}")
+_NEXT_STEP_RE = re.compile(
+    r"\b(please|next|contact|reply|submit|visit|follow)\b", re.IGNORECASE
+)
+_POLICY_KEYWORDS = {
+    policy: frozenset(_KEYWORD_RE.findall(policy.casefold()))
+    for policy in POLICIES.values()
 }
 
-ALLOWED_CATEGORIES = {"refund", "shipping", "billing", "technical", "other"}
+
+Category = Literal[ALLOWED_CATEGORIES]
 
 
 class TicketState(TypedDict, total=False):
     message: str
+    # Casefolded once by _initial_state(); keyword matching reads this instead
+    # of lowercasing the message again. Optional for direct graph callers.
+    message_lower: str
     category: str
     policy: str
     needs_human: bool
-    draft: str
+    # Every draft is appended, including the handoff notice, so retries stay
+    # auditable; the reply to send is the last entry.
+    drafts: Annotated[list[str], operator.add]
     review_passed: bool
-    attempts: int
+    attempts: Annotated[int, operator.add]
 
 
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+# gather(return_exceptions=True) hands back a failed ticket's exception.
+TicketResult = Union[TicketState, BaseException]
 
 
-def classify_issue(state: TicketState) -> TicketState:
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            (
-                "system",
-                "Classify the customer message into one of: refund, shipping, billing, "
-                "technical, other. Reply with exactly one word.",
-            ),
-            ("human", "{message}"),
-        ]
-    )
-    response = llm.invoke(prompt.format_messages(message=state["message"]))
-    category = response.content.strip().lower()
-    if category not in ALLOWED_CATEGORIES:
-        category = "other"
-    return {"category": category}
+class TriageDraft(BaseModel):
+    category: Category
+    draft: str
+
+
+class ReviewResult(BaseModel):
+    passed: bool
+    reason: str
+
+
+# temperature=0 keeps replies deterministic, so repeated prompts can be served
+# from the process-wide cache instead of another OpenAI round-trip.
+set_llm_cache(InMemoryCache())
+
+CLASSIFY_DRAFT_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        SystemMessage(content=SYSTEM_PREFIX),
+        (
+            "system",
+            "Step: classify and draft. Classify the customer message, then draft "
+            "a reply that follows the policy for that category. Use the "
+            "classify-and-draft output format.",
+        ),
+        ("human", "{message}"),
+    ]
+)
+
+DRAFT_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        SystemMessage(content=SYSTEM_PREFIX),
+        (
+            "system",
+            "Step: redraft. A previous draft failed review. Draft a new reply "
+            "that follows the given policy, answers the customer, and offers "
+            "next steps. Use the draft output format.",
+        ),
+        (
+            "human",
+            "Message: {message}\nCategory: {category}\nPolicy: {policy}",
+        ),
+    ]
+)
+
+REVIEW_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        SystemMessage(content=SYSTEM_PREFIX),
+        (
+            "system",
+            "Step: review. Check the draft against the review checklist. Use the "
+            "review output format.",
+        ),
+        (
+            "human",
+            "Policy: {policy}\nDraft: {draft}",
+        ),
+    ]
+)
+
+ADAPT_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        SystemMessage(content=SYSTEM_PREFIX),
+        (
+            "system",
+            "Step: adapt. The template reply answered a different customer's "
+            "similar ticket and passed review. Rewrite it for this customer's "
+            "message, keeping its policy wording and next step. Never carry over "
+            "that customer's details such as order numbers, amounts, dates, "
+            "delays, or card digits; use only details from this message, and "
+            "re-check against the policy whether this customer qualifies for "
+            "anything the template promised. Use the draft output format.",
+        ),
+        (
+            "human",
+            "Message: {message}\nPolicy: {policy}\nTemplate: {template}",
+        ),
+    ]
+)
+
+CLASSIFY_DRAFT_CHAIN = CLASSIFY_DRAFT_PROMPT | LLM.with_structured_output(
+    TriageDraft
+).bind(prompt_cache_key="triage-classify")
+DRAFT_CHAIN = DRAFT_PROMPT | LLM.bind(prompt_cache_key="triage-draft")
+REVIEW_CHAIN = REVIEW_PROMPT | LLM.with_structured_output(ReviewResult).bind(
+    prompt_cache_key="triage-review"
+)
+ADAPT_CHAIN = ADAPT_PROMPT | LLM.bind(prompt_cache_key="triage-adapt")
 
 
-def fetch_policy(state: TicketState) -> TicketState:
-    policy = POLICIES.get(state["category"], POLICIES["other"])
-    return {"policy": policy}
+def _triage_update(result: TriageDraft) -> TicketState:
+    return {
+        "category": result.category,
+        "policy": POLICIES[result.category],
+        "drafts": [result.draft.strip()],
+    }
+
+
+async def classify_and_draft(state: TicketState) -> TicketState:
+    result = await CLASSIFY_DRAFT_CHAIN.ainvoke({"message": state["message"]})
+    return {**_triage_update(result), "attempts": 1}
 
 
 def decide_handoff(state: TicketState) -> TicketState:
-    message = state["message"].lower()
-    needs_human = "chargeback" in message or "legal" in message or "lawsuit" in message
-    return {"needs_human": needs_human}
-
-
-def draft_reply(state: TicketState) -> TicketState:
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            (
-                "system",
-                "Draft a short support reply that follows the policy, answers the "
-                "customer, and offers next steps. Keep it under 120 words.",
-            ),
-            (
-                "human",
-                "Message: {message}\nCategory: {category}\nPolicy: {policy}",
-            ),
-        ]
-    )
-    response = llm.invoke(
-        prompt.format_messages(
-            message=state["message"],
-            category=state["category"],
-            policy=state["policy"],
-        )
+    # Callers that skip _initial_state() only pass "message".
+    message_lower = state.get("message_lower") or state["message"].casefold()
+    return {"needs_human": bool(_HANDOFF_RE.search(message_lower))}
+
+
+async def draft_reply(state: TicketState) -> TicketState:
+    # ainvoke rather than astream: it checks the LLM cache first and, when an
+    # astream_events consumer is attached, the model still streams tokens to
+    # it through the streaming callback handler.
+    response = await DRAFT_CHAIN.ainvoke(
+        {
+            "message": state["message"],
+            "category": state["category"],
+            "policy": state["policy"],
+        }
     )
-    attempts = state.get("attempts", 0) + 1
-    return {"draft": response.content.strip(), "attempts": attempts}
-
-
-def review_reply(state: TicketState) -> TicketState:
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            (
-                "system",
-                "Review the draft reply. Reply with PASS if it mentions the policy "
-                "and includes a next step. Otherwise reply with FAIL.",
-            ),
-            (
-                "human",
-                "Policy: {policy}\nDraft: {draft}",
-            ),
-        ]
-    )
-    response = llm.invoke(
-        prompt.format_messages(policy=state["policy"], draft=state["draft"])
-    )
-    decision = response.content.strip().lower()
-    review_passed = decision.startswith("pass")
+    return {"drafts": [response.content.strip()], "attempts": 1}
+
+
+def _heuristic_review(policy: str, draft: str) -> Optional[bool]:
+    # Checks the review criteria locally: the draft should share wording with
+    # the policy and point to a next step. None means the call is too close
+    # and the LLM reviewer decides.
+    draft_words = set(_KEYWORD_RE.findall(draft.casefold()))
+    overlap = len(_POLICY_KEYWORDS.get(policy, frozenset()) & draft_words)
+    has_next_step = _NEXT_STEP_RE.search(draft) is not None
+    if overlap >= 3 and has_next_step:
+        return True
+    if overlap == 0 and not has_next_step:
+        return False
+    return None
+
+
+async def review_reply(state: TicketState) -> TicketState:
+    # Review is also where the classify and handoff branches meet; tickets
+    # headed for a human skip the LLM review entirely.
+    if state.get("needs_human"):
+        return {}
+    draft = state["drafts"][-1]
+    review_passed = _heuristic_review(state["policy"], draft)
+    if review_passed is None:
+        result = await REVIEW_CHAIN.ainvoke({"policy": state["policy"], "draft": draft})
+        review_passed = result.passed
     return {"review_passed": review_passed}
 
 
@@ -126,14 +217,12 @@ def human_handoff(state: TicketState) -> TicketState:
         "This request needs a human agent. A specialist will review your case and "
         "follow up shortly."
     )
-    return {"draft": message}
-
-
-def route_from_handoff(state: TicketState) -> str:
-    return "handoff" if state.get("needs_human") else "draft"
+    return {"drafts": [message]}
 
 
 def route_after_review(state: TicketState) -> str:
+    if state.get("needs_human"):
+        return "handoff"
     if state.get("review_passed"):
         return "done"
     if state.get("attempts", 0) >= 2:
@@ -141,23 +230,20 @@ def route_after_review(state: TicketState) -> str:
     return "retry"
 
 
+@lru_cache(maxsize=1)
 def build_graph():
     graph = StateGraph(TicketState)
-    graph.add_node("classify", classify_issue)
-    graph.add_node("policy", fetch_policy)
+    graph.add_node("classify", classify_and_draft)
     graph.add_node("handoff_check", decide_handoff)
     graph.add_node("draft", draft_reply)
     graph.add_node("review", review_reply)
     graph.add_node("handoff", human_handoff)
 
-    graph.set_entry_point("classify")
-    graph.add_edge("classify", "policy")
-    graph.add_edge("policy", "handoff_check")
-    graph.add_conditional_edges(
-        "handoff_check",
-        route_from_handoff,
-        {"handoff": "handoff", "draft": "draft"},
-    )
+    # The handoff check does not depend on the LLM classification, so both
+    # branches start together and meet again at review.
+    graph.add_edge(START, "classify")
+    graph.add_edge(START, "handoff_check")
+    graph.add_edge(["classify", "handoff_check"], "review")
     graph.add_edge("draft", "review")
     graph.add_conditional_edges(
         "review",
@@ -169,25 +255,259 @@ def build_graph():
     return graph.compile()
 
 
+TRIAGE_CONCURRENCY = int(os.getenv("TRIAGE_CONCURRENCY", "10"))
+# Skip LangGraph and run the same nodes from plain Python (see triage_fast).
+FAST_PATH = os.getenv("FAST_PATH", "").lower() in {"1", "true", "yes"}
+# Path of the SQLite plan-template cache; unset disables it (see _triage_from_plan).
+PLAN_CACHE = os.getenv("PLAN_CACHE")
+_PLANS = PlanCache(PLAN_CACHE) if PLAN_CACHE else None
+BATCH_POLL_SECONDS = 30
+_BATCH_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+_OPENAI_ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+
+def _batch_request(index: int, message: str) -> dict:
+    # Same prompt as the classify node, so batched tickets share its cached
+    # prefix. JSON mode stands in for structured output; results are checked
+    # against TriageDraft when the batch comes back.
+    prompt = CLASSIFY_DRAFT_PROMPT.invoke({"message": message}).to_messages()
+    return {
+        "custom_id": f"ticket-{index}",
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": LLM.model_name,
+            "temperature": LLM.temperature,
+            "response_format": {"type": "json_object"},
+            "prompt_cache_key": "triage-classify",
+            "messages": [
+                {"role": _OPENAI_ROLES[m.type], "content": m.content} for m in prompt
+            ],
+        },
+    }
+
+
+def _initial_state(message: str) -> TicketState:
+    return {"message": message, "message_lower": message.casefold(), "attempts": 0}
+
+
+_REDUCERS = {
+    key: hint.__metadata__[0]
+    for key, hint in get_type_hints(TicketState, include_extras=True).items()
+    if get_origin(hint) is Annotated
+}
+
+
+def _apply_update(state: TicketState, update: TicketState) -> None:
+    # Mirrors the graph's state reducers for code that calls nodes directly.
+    for key, value in update.items():
+        reducer = _REDUCERS.get(key)
+        state[key] = reducer(state[key], value) if reducer and key in state else value
+
+
+async def _finish_ticket(state: TicketState) -> TicketState:
+    # Runs the post-classify part of the graph on an already drafted ticket.
+    _apply_update(state, decide_handoff(state))
+    while not state["needs_human"]:
+        _apply_update(state, await review_reply(state))
+        route = route_after_review(state)
+        if route == "done":
+            return state
+        if route == "handoff":
+            break
+        _apply_update(state, await draft_reply(state))
+    _apply_update(state, human_handoff(state))
+    return state
+
+
+async def triage_many(messages: list[str]) -> list[TicketResult]:
+    """Classify and draft tickets through the OpenAI Batch API.
+
+    Review, retries, and handoffs run locally once the batch completes.
+    Tickets whose batch line failed go through the full graph instead, and a
+    ticket that still fails is returned as its exception.
+    """
+
+    client = AsyncOpenAI(http_client=SHARED_ASYNC_HTTP)
+    lines = "\n".join(json.dumps(_batch_request(i, m)) for i, m in enumerate(messages))
+    batch_file = await client.files.create(
+        file=("tickets.jsonl", lines.encode("utf-8")), purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    while batch.status not in _BATCH_FINAL_STATUSES:
+        await asyncio.sleep(BATCH_POLL_SECONDS)
+        batch = await client.batches.retrieve(batch.id)
+
+    drafted: dict[int, TicketState] = {}
+    if batch.output_file_id:
+        output = await client.files.content(batch.output_file_id)
+        for line in output.text.splitlines():
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                continue
+            content = response["body"]["choices"][0]["message"]["content"]
+            try:
+                result = TriageDraft.model_validate_json(content)
+            except ValidationError:
+                continue
+            index = int(record["custom_id"].removeprefix("ticket-"))
+            drafted[index] = _triage_update(result)
+
+    sem = asyncio.Semaphore(TRIAGE_CONCURRENCY)
+
+    async def finish(index: int, message: str) -> TicketState:
+        if index not in drafted:
+            return await _handle_ticket(message, sem)
+        async with sem:
+            return await _finish_ticket(
+                {**_initial_state(message), "attempts": 1, **drafted[index]}
+            )
+
+    return await asyncio.gather(
+        *(finish(i, m) for i, m in enumerate(messages)), return_exceptions=True
+    )
+
+
+async def triage_fast(message: str) -> TicketState:
+    """Run the graph's steps directly, without LangGraph's per-node overhead.
+
+    Produces the same final state as build_graph() for the fixed
+    classify -> handoff check -> review -> redraft topology.
+    """
+
+    state = _initial_state(message)
+    _apply_update(state, await classify_and_draft(state))
+    return await _finish_ticket(state)
+
+
+async def _triage_from_plan(message: str) -> Optional[TicketState]:
+    # Agentic plan caching: a ticket whose keywords match a stored plan reuses
+    # that plan's category and reviewed reply as a template. The reply was
+    # written for another customer, so every hit is adapted by the LLM in one
+    # call and reviewed. Handoffs and adapted drafts that fail review fall back
+    # to the full workflow.
+    state = _initial_state(message)
+    _apply_update(state, decide_handoff(state))
+    if state["needs_human"]:
+        return None
+    plan = _PLANS.lookup(state["message_lower"])
+    if plan is None:
+        return None
+    policy = POLICIES[plan.category]
+    response = await ADAPT_CHAIN.ainvoke(
+        {"message": message, "policy": policy, "template": plan.draft_template}
+    )
+    _apply_update(
+        state,
+        {
+            "category": plan.category,
+            "policy": policy,
+            "drafts": [response.content.strip()],
+            "attempts": 1,
+        },
+    )
+    _apply_update(state, await review_reply(state))
+    return state if state["review_passed"] else None
+
+
+async def _triage(message: str) -> TicketState:
+    if _PLANS is not None and (state := await _triage_from_plan(message)):
+        return state
+    if FAST_PATH:
+        state = await triage_fast(message)
+    else:
+        state = await build_graph().ainvoke(_initial_state(message))
+    if _PLANS is not None and state.get("review_passed") and not state["needs_human"]:
+        _PLANS.store(state["message_lower"], state["category"], state["drafts"][-1])
+    return state
+
+
+async def _handle_ticket(message: str, sem: asyncio.Semaphore) -> TicketState:
+    async with sem:
+        return await _triage(message)
+
+
+async def arun_many(messages: list[str]) -> list[TicketResult]:
+    """Triage tickets concurrently, at most TRIAGE_CONCURRENCY at a time.
+
+    A ticket that fails is returned as its exception so the others still
+    come back.
+    """
+
+    sem = asyncio.Semaphore(TRIAGE_CONCURRENCY)
+    return await asyncio.gather(
+        *(_handle_ticket(m, sem) for m in messages), return_exceptions=True
+    )
+
+
+async def astream_ticket(message: str) -> TicketState:
+    """Triage one ticket, echoing drafts to stderr while review is pending."""
+
+    result: TicketState = {}
+    events = build_graph().astream_events(_initial_state(message), version="v2")
+    async for event in events:
+        kind = event["event"]
+        node = event["metadata"].get("langgraph_node")
+        if not event["parent_ids"]:
+            if kind == "on_chain_end":
+                result = event["data"]["output"]
+        elif node == "classify" and kind == "on_chain_end" and event["name"] == node:
+            # The first draft arrives whole inside the structured classify
+            # output, so surface it before review runs.
+            draft = event["data"]["output"]["drafts"][-1]
+            print(f"draft (pending review): {draft}", file=sys.stderr, flush=True)
+        elif node == "draft" and kind == "on_chat_model_start":
+            print("redraft (pending review): ", end="", file=sys.stderr, flush=True)
+        elif node == "draft" and kind == "on_chat_model_stream":
+            print(event["data"]["chunk"].content, end="", file=sys.stderr, flush=True)
+        elif node == "draft" and kind == "on_chat_model_end":
+            print(file=sys.stderr, flush=True)
+    return result
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="LangGraph support workflow example")
     parser.add_argument(
-        "message",
-        nargs="?",
-        default=(
+        "messages",
+        nargs="*",
+        default=[
             "I see a duplicate charge and I might file a chargeback. "
             "Please fix this."
-        ),
-        help="Customer message to triage",
+        ],
+        help="Customer messages to triage",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Classify and draft through the OpenAI Batch API (can take hours)",
     )
     args = parser.parse_args()
 
-    graph = build_graph()
-    result = graph.invoke({"message": args.message, "attempts": 0})
-
-    print(f"category: {result.get('category')}")
-    print(f"needs_human: {result.get('needs_human')}")
-    print(result.get("draft", ""))
+    if args.batch:
+        results = asyncio.run(triage_many(args.messages))
+    elif len(args.messages) == 1 and not FAST_PATH and _PLANS is None:
+        results = [asyncio.run(astream_ticket(args.messages[0]))]
+    else:
+        results = asyncio.run(arun_many(args.messages))
+
+    failed = False
+    for index, result in enumerate(results):
+        if index:
+            print()
+        if isinstance(result, BaseException):
+            failed = True
+            print(f"error: {result!r}")
+            continue
+        print(f"category: {result.get('category')}")
+        print(f"needs_human: {result.get('needs_human')}")
+        print(result["drafts"][-1])
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,21 @@
+import httpx
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+
+load_dotenv()
+
+# One connection pool per process: the LangChain agent, the LangGraph nodes,
+# and the Batch API client all reuse the same keep-alive TLS connections
+# instead of each paying for its own handshake on the first call.
+_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+
+SHARED_HTTP = httpx.Client(limits=_LIMITS, timeout=60)
+SHARED_ASYNC_HTTP = httpx.AsyncClient(limits=_LIMITS, timeout=60)
+
+LLM = ChatOpenAI(
+    model="gpt-4o-mini",
+    temperature=0,
+    http_client=SHARED_HTTP,
+    http_async_client=SHARED_ASYNC_HTTP,
+    max_retries=3,
+)
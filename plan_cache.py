@@ -0,0 +1,83 @@
+import re
+import sqlite3
+from collections import defaultdict
+from typing import NamedTuple, Optional
+
+# Numbers stay in the key, so "12 days late" and "3 days late" differ.
+_WORD_RE = re.compile(r"[a-z]{4,}|\d+")
+_STOPWORDS = frozenset(
+    "about after also been could does from have into just like might more please "
+    "some than that their them then there they this want were what when which "
+    "will with would your".split()
+)
+
+
+def extract_keywords(message_lower: str) -> frozenset[str]:
+    return frozenset(
+        word for word in _WORD_RE.findall(message_lower) if word not in _STOPWORDS
+    )
+
+
+class PlanHit(NamedTuple):
+    category: str
+    draft_template: str
+    confidence: float
+
+
+class PlanCache:
+    """SQLite-backed plan templates keyed by the intent keywords of a ticket.
+
+    A plan is the category and reviewed reply of a past ticket. A lookup
+    scores the ticket's own keyword set against each stored keyword set by
+    Jaccard similarity, so whole words must match and extra words on either
+    side lower the score. Plans are loaded once and indexed by keyword, so a
+    lookup only scores plans sharing a keyword with the ticket and a store
+    updates the index in place.
+    """
+
+    def __init__(self, path: str, min_confidence: float = 0.6) -> None:
+        self.min_confidence = min_confidence
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS plans ("
+            "keywords TEXT PRIMARY KEY, category TEXT NOT NULL, "
+            "draft_template TEXT NOT NULL)"
+        )
+        self._plans: dict[frozenset[str], tuple[str, str]] = {}
+        self._index: defaultdict[str, set[frozenset[str]]] = defaultdict(set)
+        rows = self._conn.execute(
+            "SELECT keywords, category, draft_template FROM plans"
+        )
+        for keywords, category, draft_template in rows:
+            self._add(frozenset(keywords.split()), category, draft_template)
+
+    def _add(self, keyset: frozenset[str], category: str, draft_template: str) -> None:
+        self._plans[keyset] = (category, draft_template)
+        for word in keyset:
+            self._index[word].add(keyset)
+
+    def lookup(self, message_lower: str) -> Optional[PlanHit]:
+        keywords = extract_keywords(message_lower)
+        if not keywords:
+            return None
+        candidates = set().union(*(self._index.get(word, ()) for word in keywords))
+        best: Optional[PlanHit] = None
+        for keyset in candidates:
+            category, draft_template = self._plans[keyset]
+            confidence = len(keyset & keywords) / len(keyset | keywords)
+            if confidence >= self.min_confidence and (
+                best is None or confidence > best.confidence
+            ):
+                best = PlanHit(category, draft_template, confidence)
+        return best
+
+    def store(self, message_lower: str, category: str, draft_template: str) -> None:
+        keywords = extract_keywords(message_lower)
+        if not keywords:
+            return
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO plans VALUES (?, ?, ?)",
+                (" ".join(sorted(keywords)), category, draft_template),
+            )
+        self._add(keywords, category, draft_template)
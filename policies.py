@@ -0,0 +1,53 @@
+import sys
+from types import MappingProxyType
+from typing import Mapping
+
+import ahocorasick
+
+# Single read-only copy of the support policies shared by both examples.
+POLICIES: Mapping[str, str] = MappingProxyType(
+    {
+        sys.intern(key): value
+        for key, value in {
+            "refund": (
+                "Refunds: Full refunds are allowed within 30 days of purchase if the "
+                "item is unused. Partial refunds (up to 50%) are allowed for used "
+                "items within 30 days. No refunds after 30 days."
+            ),
+            "shipping": (
+                "Shipping: Standard shipping is 5-7 business days. Expedited "
+                "shipping is 2-3 business days. Delays over 10 business days "
+                "qualify for a 10% credit."
+            ),
+            "billing": (
+                "Billing: Duplicate charges can be reversed within 5 business days. "
+                "Chargebacks are escalated to a human agent immediately."
+            ),
+            "technical": (
+                "Technical: Troubleshoot by confirming account access, resetting "
+                "password, and clearing cache. Escalate if the user is locked out "
+                "for more than 24 hours."
+            ),
+            "other": (
+                "General: Be polite, ask clarifying questions, and offer next steps."
+            ),
+        }.items()
+    }
+)
+
+# Ordered, so schemas and prompts built from it stay byte-identical run to run.
+ALLOWED_CATEGORIES = tuple(POLICIES)
+
+
+def _build_policy_automaton() -> ahocorasick.Automaton:
+    # "other" is the fallback category, not a keyword to search for.
+    automaton = ahocorasick.Automaton()
+    for key, value in POLICIES.items():
+        if key != "other":
+            automaton.add_word(key, value)
+    automaton.make_automaton()
+    return automaton
+
+
+# Maps each category keyword found in a text to its policy in one pass.
+POLICY_AUTOMATON = _build_policy_automaton()
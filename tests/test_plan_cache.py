@@ -0,0 +1,69 @@
+import pytest
+
+from plan_cache import PlanCache, extract_keywords
+
+
+@pytest.fixture
+def cache():
+    return PlanCache(":memory:")
+
+
+def test_extract_keywords_keeps_numbers_and_drops_stopwords():
+    keywords = extract_keywords("my order is 12 days late and i paid $200")
+    assert keywords == {"order", "days", "late", "paid", "12", "200"}
+
+
+def test_lookup_on_empty_cache_misses(cache):
+    assert cache.lookup("my order is late and i want a refund") is None
+
+
+def test_lookup_returns_stored_plan(cache):
+    cache.store("my order is late and i want a refund", "refund", "Reply")
+    hit = cache.lookup("my order is late, i want a refund")
+    assert hit is not None
+    assert hit.category == "refund"
+    assert hit.draft_template == "Reply"
+    assert hit.confidence == 1.0
+
+
+def test_different_numbers_lower_confidence(cache):
+    cache.store("my order is 12 days late and i paid $200", "shipping", "Reply")
+    hit = cache.lookup("my order is 3 days late and i paid $15")
+    assert hit is None or hit.confidence < 1.0
+
+
+def test_keywords_match_whole_words_only(cache):
+    cache.store("late order refund", "refund", "Reply")
+    assert cache.lookup("please translate my refund border form") is None
+
+
+def test_short_plan_does_not_match_longer_message(cache):
+    cache.store("refund", "refund", "Reply")
+    assert cache.lookup("refund for a blender that arrived cracked yesterday") is None
+
+
+def test_best_match_wins(cache):
+    cache.store("duplicate charge card", "billing", "Billing reply")
+    cache.store("duplicate charge card refund", "refund", "Refund reply")
+    hit = cache.lookup("duplicate charge on my card")
+    assert hit.category == "billing"
+
+
+def test_store_replaces_plan_with_same_keywords(cache):
+    cache.store("order late", "shipping", "Old reply")
+    cache.store("late order", "shipping", "New reply")
+    assert cache.lookup("order late").draft_template == "New reply"
+
+
+def test_lookup_after_store_does_not_reload_from_sqlite(cache, monkeypatch):
+    cache.store("order late", "shipping", "Reply")
+    # Any SQLite access from here on would raise AttributeError.
+    monkeypatch.setattr(cache, "_conn", None)
+    assert cache.lookup("order late").category == "shipping"
+
+
+def test_plans_persist_across_instances(tmp_path):
+    path = str(tmp_path / "plans.db")
+    PlanCache(path).store("order late", "shipping", "Reply")
+    hit = PlanCache(path).lookup("order late")
+    assert hit.category == "shipping"